@@ -1,57 +1,157 @@
 import os
-import glob
+import numpy as np
 import pandas as pd
-from datetime import datetime, time
+import polars as pl
+from datetime import datetime
 from dash import Dash, dcc, html, Input, Output
 import plotly.express as px
+import plotly.io as pio
 from dash import dash_table
 from dash import ctx
+from flask_caching import Cache
 import io
+import hashlib
+import shutil
+from functools import lru_cache
 import base64
+import duckdb
+from excel_cache import cache_all_excels
 
 
 
 # === Load and preprocess Excel files ===
-def load_all_excels(folder_path):
-    all_files = glob.glob(folder_path + "/*.xlsx")
-    valid_files = [file for file in all_files if not os.path.basename(file).startswith('~$')]
-    df_list = []
-    for file in valid_files:
-        df = pd.read_excel(file)
-        df.columns = df.columns.str.strip()  # Clean column names
-        if not df.dropna(how='all').empty:
-            df_list.append(df)
-    return pd.concat(df_list, ignore_index=True)
+def preprocess(df_raw):
+    # === Rename column ===
+    df_raw = df_raw.rename(columns={'LPG . No.': 'Chainage'})
+
+    # === Preprocessing ===
+    df_raw['Alert Time'] = pd.to_datetime(df_raw['Alert Time'], errors='coerce', dayfirst=True)
+    df_raw['Date'] = df_raw['Alert Time'].dt.normalize()  # datetime64, not python date objects
+    df_raw['Hour'] = df_raw['Alert Time'].dt.hour.astype('int8[pyarrow]')
+
+    # Day alarms are raised between 06:00 and 22:00 inclusive
+    time_of_day = df_raw['Alert Time'] - df_raw['Date']
+    is_day = time_of_day.between(pd.Timedelta(hours=6), pd.Timedelta(hours=22)).to_numpy(dtype=bool, na_value=False)
+    alarm_type = np.select([df_raw['Alert Time'].isna().to_numpy(), is_day], ['Unknown', 'Day'], default='Night')
+    df_raw['Alarm Type'] = pd.Categorical(alarm_type, categories=['Day', 'Night', 'Unknown'])
+    df_raw['Verified'] = (df_raw['Resolution remarks with time'].notna().to_numpy() |
+                          df_raw['Resolution remarks with time/Day Guard'].notna().to_numpy())
+    df_raw = df_raw.drop(columns=['Resolution remarks with time', 'Resolution remarks with time/Day Guard'])
+
+    # Low-cardinality text columns compare and store as integer codes
+    for col in ['Section', 'Event Type', 'Alert Type/Severity']:
+        df_raw[col] = df_raw[col].astype('category')
+    return df_raw
+
+def build_section_dataset(cache_files, cache_dir, dataset_version, source_columns):
+    # Named after the cached workbooks, their mtimes and the columns read, so any change or removal
+    # rebuilds it. Bump dataset_version whenever the files written below change. Old datasets may
+    # still be read by running server workers, they are only removed before start (prune_datasets).
+    fingerprint = hashlib.md5(repr([dataset_version, source_columns] + [(f, os.path.getmtime(f)) for f in cache_files]).encode()).hexdigest()[:12]
+    dataset_dir = os.path.join(cache_dir, f"sections-{fingerprint}")
+    if os.path.isdir(dataset_dir):
+        return dataset_dir
+
+    # Arrow-backed pandas columns, shared with Polars/DuckDB without conversion
+    # Only the columns the dashboard uses are read from the workbook caches
+    df_raw = (duckdb.read_parquet(cache_files, union_by_name=True)
+              .project(', '.join(f'"{col}"' for col in source_columns))
+              .fetch_arrow_table().to_pandas(types_mapper=pd.ArrowDtype))
+    df_pl = (pl.from_pandas(preprocess(df_raw))
+             .with_columns(pl.col('Date').cast(pl.Date))  # int32 days since epoch
+             .filter(pl.col('Section').is_not_null()))
+
+    # Hive layout (Section=<name>/...), written to a temp dir first so a failed build is never picked up
+    tmp_dir = f"{dataset_dir}.{os.getpid()}.tmp"
+    con = duckdb.connect()
+    con.register('alarms', df_pl.to_arrow())
+    con.execute(f"COPY alarms TO '{tmp_dir}' (FORMAT PARQUET, PARTITION_BY (Section), COMPRESSION ZSTD)")
+    # Alarm counts per hour are all the graphs need, small enough to keep in memory
+    (df_pl.group_by(['Section', 'Alarm Type', 'Date', 'Hour'])
+          .agg(total_alarms=pl.len(), verified=pl.col('Verified').sum())
+          .write_parquet(os.path.join(tmp_dir, "counts.parquet")))
+    try:
+        os.replace(tmp_dir, dataset_dir)
+    except OSError:
+        # Another server worker finished building the same dataset first
+        shutil.rmtree(tmp_dir)
+    return dataset_dir
 
 # === Constants ===
 folder_path = "data"
-df_raw = load_all_excels(folder_path)
+cache_dir = "data/.parquet_cache"
+# Workbooks are converted in parallel once before the server starts (gunicorn.conf.py or
+# python excel_cache.py), so this only converts in-process what is still stale
+cache_files = cache_all_excels(folder_path, cache_dir)
+dataset_version = 4
+source_columns = [
+    'Section', 'LPG . No.', 'Alert Type/Severity', 'Alert Time', 'Alert Duration(HH:MM:SS)',
+    'Latitude', 'Longitude', 'Event Type',
+    'Resolution remarks with time', 'Resolution remarks with time/Day Guard'
+]
+dataset_dir = build_section_dataset(cache_files, cache_dir, dataset_version, source_columns)
+alarms_source = f"read_parquet('{os.path.join(dataset_dir, '*', '*.parquet')}', hive_partitioning = true)"
+alarm_counts = pl.read_parquet(os.path.join(dataset_dir, "counts.parquet"))
 
+# === Dash App ===
+# Dash serializes callback responses (figures and table rows) through plotly's JSON encoder
+pio.json.config.default_engine = 'orjson'
 
-# === Rename column ===
-df_raw.rename(columns={'LPG . No.': 'Chainage'}, inplace=True)
-
-# === Preprocessing ===
-df_raw['Alert Time'] = pd.to_datetime(df_raw['Alert Time'], errors='coerce', dayfirst=True)
-df_raw['Date'] = df_raw['Alert Time'].dt.date
-df_raw['Hour'] = df_raw['Alert Time'].dt.hour
-
-def classify_alarm_type(t):
-    if pd.isnull(t):
-        return 'Unknown'
-    if time(6, 0) <= t.time() <= time(22, 0):
-        return 'Day'
-    return 'Night'
-
-df_raw['Alarm Type'] = df_raw['Alert Time'].apply(classify_alarm_type)
-df_raw['Verified'] = df_raw[['Resolution remarks with time', 'Resolution remarks with time/Day Guard']].notnull().any(axis=1)
+# compress=True gzips responses (figure JSON, table rows, downloads) via Flask-Compress
+app = Dash(__name__, compress=True)
+app.title = "Alarm Dashboard"
+server = app.server  # WSGI entry point: gunicorn app:server (settings in gunicorn.conf.py)
+
+# Graph, table and download callbacks ask for the same filters, compute them once.
+# Kept on disk so all gunicorn workers share it (a download may hit another worker than the table),
+# next to the dataset so a rebuild starts with an empty cache and old ones are cleaned up with it
+cache = Cache(app.server, config={'CACHE_TYPE': 'FileSystemCache', 'CACHE_DIR': f"{dataset_dir}.callbacks",
+                                  'CACHE_DEFAULT_TIMEOUT': 600})
+
+con = duckdb.connect()
+
+# === Per-section data, read on first use ===
+@lru_cache(maxsize=8)
+def load_section(section):
+    # Filtering on the partition column means DuckDB only reads this section's files
+    section_df = con.cursor().execute(f"SELECT * FROM {alarms_source} WHERE Section = ?", [section]).pl()
+    section_df = (section_df
+                  .with_columns(pl.col('Alarm Type', 'Event Type', 'Alert Type/Severity').cast(pl.Categorical))
+                  .sort(['Date', 'Alert Time'], nulls_last=True, maintain_order=True))
+    # Split per alarm type and sorted by date, so a date range is a binary-searched slice
+    return {alarm_type: section_df.filter(pl.col('Alarm Type') == alarm_type) for alarm_type in ['Day', 'Night']}
+
+@cache.memoize()
+def apply_filter(alarm_type, start_date, end_date, section):
+    parts = load_section(section)
+    part = parts.get(alarm_type, parts['Day'].clear())
+    lo = part['Date'].search_sorted(pd.to_datetime(start_date).date(), side='left')
+    hi = part['Date'].search_sorted(pd.to_datetime(end_date).date(), side='right')
+    return part.slice(lo, hi - lo)
+
+@cache.memoize()
+def get_unverified(alarm_type, start_date, end_date, section):
+    # Shared by the table and the download, so clicking download reuses the table's result
+    filtered = apply_filter(alarm_type, start_date, end_date, section)
+    # Unverified alarms with coordinates, checked in a single pass
+    return filtered.filter(~pl.col('Verified') &
+                           pl.all_horizontal(pl.col('Chainage', 'Latitude', 'Longitude').is_not_null()))
+
+# === Graph data from the precomputed counts ===
+@cache.memoize()
+def get_counts(group_by, alarm_type, start_date, end_date, section):
+    return (alarm_counts
+            .filter((pl.col('Section') == section) & (pl.col('Alarm Type') == alarm_type) &
+                    pl.col('Date').is_between(pd.to_datetime(start_date).date(), pd.to_datetime(end_date).date()))
+            .group_by(group_by)
+            .agg(pl.col('total_alarms').sum(), pl.col('verified').sum())
+            .with_columns(unverified=pl.col('total_alarms') - pl.col('verified'))
+            .sort(group_by)
+            .to_pandas())
 
 # === Unique Values ===
-sections = df_raw['Section'].dropna().unique()
-
-# === Dash App ===
-app = Dash(__name__)
-app.title = "Alarm Dashboard"
+sections = sorted(alarm_counts['Section'].unique().to_list())
+first_date, last_date = alarm_counts['Date'].min(), alarm_counts['Date'].max()
 
 app.layout = html.Div(style={'fontFamily': 'Arial', 'backgroundColor': '#f8f9fa', 'padding': '20px'}, children=[
     html.H1("🚨 PIDWS Alarm Dashboard", style={"textAlign": "center", "color": "#343a40"}),
@@ -65,15 +165,15 @@ app.layout = html.Div(style={'fontFamily': 'Arial', 'backgroundColor': '#f8f9fa'
             html.Label("📅 Select Date Range:", style={'fontWeight': 'bold'}),
             dcc.DatePickerRange(
                 id='date-range',
-                start_date=df_raw['Date'].min(),
-                end_date=df_raw['Date'].max(),
+                start_date=first_date,
+                end_date=last_date,
                 display_format='DD-MM-YYYY',
                 style={'border': '1px solid #ced4da', 'padding': '5px'}
             )
         ]),
         html.Div([
             html.Label("📍 Select Section:", style={'fontWeight': 'bold'}),
-            dcc.Dropdown(list(sections), sections[0], id='section', style={'width': '250px'})
+            dcc.Dropdown(sections, sections[0], id='section', style={'width': '250px'})
         ])
     ], style={
         'display': 'flex',
@@ -136,25 +236,23 @@ app.layout = html.Div(style={'fontFamily': 'Arial', 'backgroundColor': '#f8f9fa'
     Input('section', 'value')
 )
 def update_alarm_count_graph(alarm_type, start_date, end_date, section):
-    filtered = df_raw[(df_raw['Alarm Type'] == alarm_type) &
-                      (df_raw['Date'] >= pd.to_datetime(start_date).date()) &
-                      (df_raw['Date'] <= pd.to_datetime(end_date).date()) &
-                      (df_raw['Section'] == section)]
-
     if start_date == end_date:
-        fig = px.histogram(
-            filtered,
+        counts = get_counts('Hour', alarm_type, start_date, end_date, section)
+        fig = px.bar(
+            counts,
             x='Hour',
-            nbins=24,
+            y='total_alarms',
             title="Alarms Distribution by Hour",
-            labels={'Hour': 'Hour of Day', 'count': 'Number of Alarms'}
+            labels={'Hour': 'Hour of Day', 'total_alarms': 'Number of Alarms'}
         )
     else:
-        fig = px.histogram(
-            filtered,
+        counts = get_counts('Date', alarm_type, start_date, end_date, section)
+        fig = px.bar(
+            counts,
             x='Date',
+            y='total_alarms',
             title="Alarms Distribution by Date",
-            labels={'Date': 'Date', 'count': 'Number of Alarms'}
+            labels={'Date': 'Date', 'total_alarms': 'Number of Alarms'}
         )
 
     fig.update_layout(bargap=0.2, xaxis_tickformat="%d-%m-%Y" if start_date != end_date else None)
@@ -168,16 +266,7 @@ def update_alarm_count_graph(alarm_type, start_date, end_date, section):
     Input('section', 'value')
 )
 def update_verify_graph(alarm_type, start_date, end_date, section):
-    filtered = df_raw[(df_raw['Alarm Type'] == alarm_type) &
-                      (df_raw['Date'] >= pd.to_datetime(start_date).date()) &
-                      (df_raw['Date'] <= pd.to_datetime(end_date).date()) &
-                      (df_raw['Section'] == section)]
-
-    summary = filtered.groupby('Date').agg(
-        total_alarms=('Alert Time', 'count'),
-        verified=('Verified', lambda x: x.sum()),
-        unverified=('Verified', lambda x: (~x).sum())
-    ).reset_index()
+    summary = get_counts('Date', alarm_type, start_date, end_date, section)
 
     fig = px.bar(summary, x='Date', y=['total_alarms', 'verified', 'unverified'],
                  title="Alarm Verification Status",
@@ -201,25 +290,17 @@ def update_verify_graph(alarm_type, start_date, end_date, section):
     Input('section', 'value')
 )
 def update_unverified_table(alarm_type, start_date, end_date, section):
-    filtered = df_raw[(df_raw['Alarm Type'] == alarm_type) &
-                      (df_raw['Date'] >= pd.to_datetime(start_date).date()) &
-                      (df_raw['Date'] <= pd.to_datetime(end_date).date()) &
-                      (df_raw['Section'] == section) &
-                      (~df_raw['Verified'])]
-
-    # Drop rows without coordinates
-    filtered = filtered.dropna(subset=['Chainage', 'Latitude', 'Longitude'])
+    filtered = get_unverified(alarm_type, start_date, end_date, section)
 
     # Create Google Maps link as Markdown
-    filtered['Location'] = filtered.apply(
-      lambda row: f"[📍](https://www.google.com/maps?q={row['Latitude']},{row['Longitude']}&t=k)",
-      axis=1
-    )
+    filtered = filtered.with_columns(Location=pl.format(
+      "[📍](https://www.google.com/maps?q={},{}&t=k)", pl.col('Latitude'), pl.col('Longitude')
+    ))
 
-    return filtered[[
+    return filtered.select([
         'Section','Chainage', 'Alert Type/Severity', 'Alert Time',
         'Alert Duration(HH:MM:SS)', 'Event Type', 'Location'
-    ]].to_dict('records')
+    ]).to_dicts()
 
 @app.callback(
     Output("download-excel", "data"),
@@ -234,24 +315,18 @@ def download_unverified_excel(n_clicks, alarm_type, start_date, end_date, sectio
     if ctx.triggered_id != 'download-excel-btn':
         return None
 
-    filtered = df_raw[(df_raw['Alarm Type'] == alarm_type) &
-                      (df_raw['Date'] >= pd.to_datetime(start_date).date()) &
-                      (df_raw['Date'] <= pd.to_datetime(end_date).date()) &
-                      (df_raw['Section'] == section) &
-                      (~df_raw['Verified'])]
-
-    filtered = filtered.dropna(subset=['Chainage', 'Latitude', 'Longitude'])
+    filtered = get_unverified(alarm_type, start_date, end_date, section)
 
     # Reorganize columns and remove hyperlink formatting
-    download_df = filtered[[
+    download_df = filtered.select([
         'Section','Chainage', 'Alert Type/Severity', 'Alert Time',
         'Alert Duration(HH:MM:SS)', 'Event Type', 'Latitude', 'Longitude'
-    ]]
+    ])
 
     # Convert to Excel in-memory
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        download_df.to_excel(writer, index=False, sheet_name='Unverified Alarms')
+    # Keep the source's 6 decimals for coordinates (Polars defaults to 3) and no autofilter, like the old export
+    download_df.write_excel(workbook=output, worksheet='Unverified Alarms', float_precision=6, autofilter=False)
     output.seek(0)
 
 
@@ -0,0 +1,74 @@
+import os
+import sys
+import glob
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+
+# Bump whenever excel_to_parquet() writes different columns or types, so every workbook is re-parsed
+cache_version = 2
+
+# === Convert Excel workbooks to Parquet caches ===
+def excel_to_parquet(file, cache_file):
+    df = pd.read_excel(file, engine='calamine')
+    df.columns = df.columns.str.strip()  # Clean column names
+    if df.dropna(how='all').empty:
+        df = df.iloc[0:0]
+    # Chainage is typed either as a number or as text like "Ch268.897", keep it numeric for every workbook
+    if 'LPG . No.' in df.columns:
+        chainage = df['LPG . No.'].astype('string').str.strip().str.replace(r'^ch\s*', '', case=False, regex=True)
+        df['LPG . No.'] = pd.to_numeric(chainage, errors='coerce').astype('Float64')
+    # Some other columns mix numbers and text too, Parquet needs one type per column
+    for col in df.columns[df.dtypes == object]:
+        if df[col].dropna().map(type).nunique() > 1:
+            df[col] = df[col].astype('string')
+    # Written under a per-process name and swapped in, so other server workers never read a partial file
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_file, engine='pyarrow', compression='zstd', index=False)
+    os.replace(tmp_file, cache_file)
+
+def cache_all_excels(folder_path, cache_dir, parallel=False):
+    all_files = glob.glob(folder_path + "/*.xlsx")
+    valid_files = [file for file in all_files if not os.path.basename(file).startswith('~$')]
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_files = [os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(file))[0]}.v{cache_version}.parquet")
+                   for file in valid_files]
+
+    # Only re-parse workbooks that changed since they were last cached
+    stale = [(file, cache_file) for file, cache_file in zip(valid_files, cache_files)
+             if not os.path.exists(cache_file) or os.path.getmtime(cache_file) < os.path.getmtime(file)]
+    if parallel and len(stale) > 1:
+        # Excel parsing is CPU bound, so parse one workbook per core. Spawned workers
+        # start a fresh interpreter and only import this module, never the dashboard.
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+            list(executor.map(excel_to_parquet, *zip(*stale)))
+    else:
+        for file, cache_file in stale:
+            excel_to_parquet(file, cache_file)
+
+    return [cache_file for cache_file in cache_files if pq.read_metadata(cache_file).num_rows > 0]
+
+# === Remove old section datasets ===
+def prune_datasets(cache_dir, keep=2):
+    # The dashboard builds cache_dir/sections-<hash> and never deletes one, since workers of a
+    # running server may still read it. Keeping the newest two leaves the one those workers use.
+    dataset_dirs = [path for path in glob.glob(os.path.join(cache_dir, "sections-*"))
+                    if '.' not in os.path.basename(path)]
+    dataset_dirs.sort(key=os.path.getmtime, reverse=True)
+    for dataset_dir in dataset_dirs[keep:]:
+        # Together with its callback cache and any unfinished build
+        for path in glob.glob(glob.escape(dataset_dir) + "*"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # Usage: python excel_cache.py [folder_path] [cache_dir]
+    # Run once before starting the server so the workers find every workbook already cached
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else "data"
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else "data/.parquet_cache"
+    cache_all_excels(folder_path, cache_dir, parallel=True)
+    prune_datasets(cache_dir)
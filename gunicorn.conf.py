@@ -0,0 +1,13 @@
+from excel_cache import cache_all_excels, prune_datasets
+
+# === Server settings (gunicorn app:server) ===
+workers = 4
+worker_class = 'gthread'
+threads = 8
+
+
+# Runs once in the master before any worker is started, so workbooks are converted
+# in parallel here instead of serially by every worker importing app.py
+def on_starting(server):
+    cache_all_excels("data", "data/.parquet_cache", parallel=True)
+    prune_datasets("data/.parquet_cache")